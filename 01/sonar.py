@@ -1,37 +1,104 @@
 #!/usr/bin/env python3
 
+from collections import deque
+import numpy as np
 import sys
 
 """
 Look for depth increases over arbitrarily large summed windows.
+
+Streams over any iterable of depths, keeping only a ring buffer
+of the most recent window of readings. Consecutive windows share
+all but one reading, so comparing the summed windows is the same
+as comparing the reading entering the window with the one leaving.
 """
 def count_depth_increases(depths, window_size = 1):
-    # Track increases and previous summed depth while looping through the depth readings
+    # Windows need at least one reading to have a sum to compare
+    if window_size < 1:
+        raise ValueError("Window size %d must be at least 1" % window_size)
+
+    # Track increases and the readings in the current window while looping through the depth readings
     increased = 0
-    previous_depth = None
-    for window_start in range(len(depths) - window_size + 1):
-        # Sum the values over an array slice of the specified size
-        depth = sum(depths[window_start:window_start+window_size])
-        if previous_depth is not None and depth > previous_depth:
-            # It's an increase if the curent summed depth window exceeds the previous one, if any
+    window = deque(maxlen=window_size)
+    for depth in depths:
+        if len(window) == window_size and depth > window[0]:
+            # It's an increase if the entering reading exceeds the one about to leave the window
             increased += 1
-        previous_depth = depth
+
+        # Appending to a full ring buffer drops the oldest reading
+        window.append(depth)
 
     # Done, return total number of depth increases
     return increased
 
+"""
+Lazily read depths from an input file, one integer depth value per line
+"""
+def read_depths(input_file):
+    for line in input_file:
+        yield int(line.strip())
+
+"""
+Count depth increases for a whole list of window sizes at once.
+
+Uses the same entering/leaving comparison as count_depth_increases,
+but as a single vectorized array comparison per window size over
+depths that are loaded only once. Returns a dictionary of increase
+counts by window size.
+"""
+def count_depth_increases_batch(depths, window_sizes):
+    # Accept any sequence, but avoid copying arrays (including memory maps)
+    depths = np.asarray(depths)
+
+    increases = {}
+    for window_size in window_sizes:
+        # Windows need at least one reading to have a sum to compare
+        if window_size < 1:
+            raise ValueError("Window size %d must be at least 1" % window_size)
+
+        if window_size >= len(depths):
+            # Not enough readings for two windows, so no increases
+            increases[window_size] = 0
+        else:
+            # Compare each reading entering a window against the reading leaving it
+            increases[window_size] = int(np.count_nonzero(depths[window_size:] > depths[:-window_size]))
+
+    # Done, return increases by window size
+    return increases
+
+"""
+Memory-map a binary depth file of native-endian integers written by convert_depths
+"""
+def load_depths(binary_path, dtype = np.int32):
+    return np.memmap(binary_path, dtype=dtype, mode="r")
+
+"""
+One-time conversion of the text depth format to a flat binary file
+of integers, streamed in chunks so the text never has to fit in memory.
+"""
+def convert_depths(input_path, binary_path, dtype = np.int32, chunk_size = 1 << 20):
+    with open(input_path) as input_file, open(binary_path, "wb") as binary_file:
+        chunk = []
+        for depth in read_depths(input_file):
+            chunk.append(depth)
+            if len(chunk) == chunk_size:
+                np.array(chunk, dtype=dtype).tofile(binary_file)
+                chunk = []
+
+        # Flush the final partial chunk, if any
+        if chunk:
+            np.array(chunk, dtype=dtype).tofile(binary_file)
+
 """
 Entry point for puzzle day 2021.12.01
 """
 def main(input_path):
     # Open the provided input
     with open(input_path) as input_file:
-        # Read all depths in one pass so we can reuse; one integer depth value per line
-        depths = [int(line.strip()) for line in input_file]
-
-        # Calculate and print results
-        print("Depth increases: %d" % count_depth_increases(depths))
-        print("Windowed depth increases: %d" % count_depth_increases(depths, 3))
+        # Calculate and print results, streaming the depths from the file for each pass
+        print("Depth increases: %d" % count_depth_increases(read_depths(input_file)))
+        input_file.seek(0)
+        print("Windowed depth increases: %d" % count_depth_increases(read_depths(input_file), 3))
 
 if __name__ == "__main__":
     main(sys.argv[1])
@@ -1,8 +1,18 @@
 #!/usr/bin/env python3
 
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+import numpy as np
+import os
 import re
 import sys
 
+# Compact codes for command directions used by the bulk array representation
+FORWARD = 0
+UP = 1
+DOWN = 2
+direction_codes = {"forward":FORWARD, "up":UP, "down":DOWN}
+
 """
 Process course commands to determine final position
 
@@ -41,6 +51,277 @@ def navigate(course, use_aim = False):
     # Done, return final position as a distance-depth tuple
     return (distance, depth, distance*depth)
 
+"""
+Bulk parse a course into parallel arrays of direction codes and
+integer values in a single pass, without a regular expression per step
+"""
+def parse_course(course):
+    # Split every command at once, alternating direction and value tokens
+    tokens = " ".join(course).split()
+    directions = np.array([direction_codes[d] for d in tokens[0::2]], dtype=np.int8)
+    values = np.array(tokens[1::2]).astype(np.int64)
+    return (directions, values)
+
+"""
+Split the parallel arrays from parse_course into per-step forward
+movement and signed vertical movement (down positive, up negative),
+with zeros for steps in the other direction
+"""
+def split_directions(directions, values):
+    forward = np.where(directions == FORWARD, values, 0)
+    vertical = np.where(directions == DOWN, values, 0) - np.where(directions == UP, values, 0)
+    return (forward, vertical)
+
+"""
+Vectorized variant of navigate over the parallel arrays from parse_course
+
+With aim, the aim in effect at each step is the running sum of the
+up/down adjustments, so the depth is just the sum of forward values
+weighted by that running aim.
+"""
+def navigate_arrays(directions, values, use_aim = False):
+    # Split the values by direction, zeroing out the steps in other directions
+    (forward, vertical) = split_directions(directions, values)
+
+    # Forward always adds to distance, vertical adjusts either depth or aim
+    distance = int(forward.sum())
+    if use_aim:
+        depth = int((np.cumsum(vertical) * forward).sum())
+    else:
+        depth = int(vertical.sum())
+
+    # Done, return final position as a distance-depth tuple
+    return (distance, depth, distance*depth)
+
+class CourseSegment:
+    """
+    Summarizes the effect of a contiguous run of course commands so that
+    segments can be computed independently and then combined in order.
+
+    Each step is an affine update of (distance, depth, aim), so a segment
+    only needs its total forward movement, its net vertical movement, and
+    the depth it accumulates with aim when starting from zero aim.
+    Starting from some other aim just adds that aim times the forward total.
+    """
+
+    def __init__(self, forward = 0, vertical = 0, aimed_depth = 0):
+        self.forward = forward
+        self.vertical = vertical
+        self.aimed_depth = aimed_depth
+
+    def __str__(self):
+        return "forward %d, vertical %d, aimed depth %d" % (self.forward, self.vertical, self.aimed_depth)
+
+    @classmethod
+    def from_arrays(cls, directions, values):
+        """
+        Summarize the parallel arrays produced by parse_course.
+        """
+
+        (forward, vertical) = split_directions(directions, values)
+        return cls(int(forward.sum()), int(vertical.sum()), int((np.cumsum(vertical) * forward).sum()))
+
+    @classmethod
+    def from_course(cls, course):
+        """
+        Summarize a sequence of course command strings.
+        """
+
+        return cls.from_arrays(*parse_course(course))
+
+    def combine(self, other):
+        """
+        Associatively combine this segment with the segment that follows it.
+
+        The following segment's forward movement happens with this segment's
+        net vertical movement already applied to the aim.
+        """
+
+        return CourseSegment(
+            self.forward + other.forward,
+            self.vertical + other.vertical,
+            self.aimed_depth + other.aimed_depth + self.vertical * other.forward)
+
+    def get_position(self, use_aim = False):
+        """
+        Final position after this segment when starting from the origin,
+        in the same form as navigate returns.
+        """
+
+        depth = self.aimed_depth if use_aim else self.vertical
+        return (self.forward, depth, self.forward*depth)
+
+"""
+Summarize the commands in a course file whose lines start within the
+byte range [start, end), so that adjacent ranges cover each line once.
+"""
+def summarize_course_range(input_path, start, end):
+    with open(input_path, "rb") as input_file:
+        # Skip the partial line that belongs to the previous range
+        if start > 0:
+            input_file.seek(start - 1)
+            input_file.readline()
+
+        # Read whole lines until we pass the end of our range
+        course = []
+        while input_file.tell() < end:
+            line = input_file.readline()
+            if not line:
+                break
+            course.append(line.decode())
+
+    return CourseSegment.from_course(course)
+
+"""
+Process a course file in byte range chunks across a pool of processes,
+combining the per-chunk segment summaries in order. Gives exactly the
+same final position as navigate.
+"""
+def navigate_parallel(input_path, use_aim = False, workers = None, chunk_size = 1 << 26):
+    # Split the file into byte ranges of roughly the chunk size
+    file_size = os.path.getsize(input_path)
+    starts = list(range(0, file_size, chunk_size))
+    ends = starts[1:] + [file_size]
+
+    # Summarize each range on its own process and merge in order
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        segments = executor.map(summarize_course_range, [input_path]*len(starts), starts, ends)
+        course = reduce(CourseSegment.combine, segments, CourseSegment())
+
+    # Done, return final position as a distance-depth tuple
+    return course.get_position(use_aim)
+
+class CourseIndex:
+    """
+    Checkpointed index over a long course that answers position queries
+    for any step without replaying the course from the start.
+
+    Stores the (distance, depth, aim) state every interval steps along with
+    the maximum depth reached within each interval, so that a query only
+    replays at most one interval of steps from the nearest checkpoint on
+    either end. Depth without aim is the same as the aim column, since up
+    and down then adjust depth directly.
+    """
+
+    def __init__(self, directions, values, interval = 1024):
+        # Keep the parsed course for replaying between checkpoints
+        self._directions = directions
+        self._values = values
+        self._interval = interval
+
+        # Compute the state after every step once, then keep only every interval-th
+        (distance, depth, aim) = self._replay_from((0, 0, 0), directions, values)
+        self._checkpoints = np.zeros((len(values) // interval + 1, 3), dtype=np.int64)
+        self._checkpoints[1:, 0] = distance[interval-1::interval]
+        self._checkpoints[1:, 1] = depth[interval-1::interval]
+        self._checkpoints[1:, 2] = aim[interval-1::interval]
+
+        # Track the maximum depth with and without aim within each interval of steps
+        self._block_max = np.zeros((2, -(-len(values) // interval)), dtype=np.int64)
+        if len(values):
+            block_starts = np.arange(0, len(values), interval)
+            self._block_max[0] = np.maximum.reduceat(aim, block_starts)
+            self._block_max[1] = np.maximum.reduceat(depth, block_starts)
+
+    @classmethod
+    def from_course(cls, course, interval = 1024):
+        """
+        Build an index over a sequence of course command strings.
+        """
+
+        return cls(*parse_course(course), interval=interval)
+
+    @classmethod
+    def load(cls, course, index_path):
+        """
+        Restore an index previously saved alongside the same course.
+        """
+
+        (directions, values) = parse_course(course)
+        with np.load(index_path) as sidecar:
+            if int(sidecar["steps"]) != len(values):
+                raise ValueError("Index %s does not match a course of %d steps" % (index_path, len(values)))
+            index = cls.__new__(cls)
+            index._directions = directions
+            index._values = values
+            index._interval = int(sidecar["interval"])
+            index._checkpoints = sidecar["checkpoints"]
+            index._block_max = sidecar["block_max"]
+        return index
+
+    def save(self, index_path):
+        """
+        Write the checkpoints to a compact sidecar file.
+        """
+
+        # Write through a file handle so the path is used exactly as given, like load
+        with open(index_path, "wb") as index_file:
+            np.savez_compressed(index_file, steps=len(self._values), interval=self._interval,
+                checkpoints=self._checkpoints, block_max=self._block_max)
+
+    @staticmethod
+    def _replay_from(state, directions, values):
+        # Vectorized replay of (distance, depth, aim) after each step from a starting state
+        (forward, vertical) = split_directions(directions, values)
+        aim = state[2] + np.cumsum(vertical)
+        return (state[0] + np.cumsum(forward), state[1] + np.cumsum(aim * forward), aim)
+
+    def _replay(self, start, stop):
+        # Replay from the checkpoint at or before start, returning states after steps start+1 through stop
+        checkpoint = start // self._interval
+        offset = checkpoint * self._interval
+        states = self._replay_from(self._checkpoints[checkpoint],
+            self._directions[offset:stop], self._values[offset:stop])
+        return [s[start-offset:] for s in states]
+
+    def _check_step(self, step):
+        if step < 0 or step > len(self._values):
+            raise IndexError("Step %d outside course of %d steps" % (step, len(self._values)))
+
+    def get_position(self, step, use_aim = False):
+        """
+        Position after the specified number of steps, in the same form as navigate returns.
+        """
+
+        self._check_step(step)
+        if step % self._interval == 0:
+            (distance, depth, aim) = [int(v) for v in self._checkpoints[step // self._interval]]
+        else:
+            (distance, depth, aim) = [int(s[-1]) for s in self._replay(step - 1, step)]
+
+        # Without aim, up and down adjusted depth directly, which is what aim tracked
+        if not use_aim:
+            depth = aim
+        return (distance, depth, distance*depth)
+
+    def get_max_depth(self, first_step, last_step, use_aim = False):
+        """
+        Maximum depth reached after any step between the first and last steps inclusive.
+        """
+
+        self._check_step(first_step)
+        self._check_step(last_step)
+        if first_step > last_step:
+            raise ValueError("First step %d is after last step %d" % (first_step, last_step))
+        column = 1 if use_aim else 2
+
+        # Start with the position at the first step, then consider the steps after it
+        max_depth = self.get_position(first_step, use_aim)[1]
+
+        # Find the full intervals inside the range; only the partial ends need replaying
+        first_block = -(-first_step // self._interval)
+        last_block = last_step // self._interval
+        if first_block < last_block:
+            spans = [(first_step, first_block * self._interval), (last_block * self._interval, last_step)]
+            max_depth = max(max_depth, int(self._block_max[int(use_aim), first_block:last_block].max()))
+        else:
+            spans = [(first_step, last_step)]
+        for (start, stop) in spans:
+            if start < stop:
+                max_depth = max(max_depth, int(self._replay(start, stop)[column].max()))
+
+        return max_depth
+
 """
 Entry point for puzzle day 2021.12.02
 """
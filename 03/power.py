@@ -1,7 +1,12 @@
 #!/usr/bin/env python3
 
+from bisect import bisect_left
+import numpy as np
 import sys
 
+# Number of records above which bit counting switches to the vectorized path
+VECTORIZED_RECORD_COUNT = 10000
+
 """
 Shared helper method that counts the number of high
 bits in each place across all input records
@@ -30,6 +35,31 @@ def count_high_bits(records):
 
     return high_bit_counts
 
+"""
+Pack integer records into a 2D array with one row of big-endian
+bytes per record, wide enough for the widest record, so records
+of any width (including above 64 bits) can be processed in bulk.
+"""
+def pack_records(records):
+    width = max(records, default=0).bit_length()
+    record_bytes = (width + 7) // 8
+    packed = np.frombuffer(b"".join([r.to_bytes(record_bytes, "big") for r in records]), dtype=np.uint8)
+    return (packed.reshape(len(records), record_bytes), width)
+
+"""
+Vectorized variant of count_high_bits over packed records, giving
+the same counts, least significant place first. Unpacks the bits
+in chunks of records so memory stays bounded.
+"""
+def count_high_bits_packed(packed, width, chunk_size = 1 << 16):
+    # Sum the unpacked bit planes of each chunk of records at once
+    totals = np.zeros(packed.shape[1] * 8, dtype=np.int64)
+    for chunk_start in range(0, len(packed), chunk_size):
+        bits = np.unpackbits(packed[chunk_start:chunk_start+chunk_size], axis=1)
+        totals += bits.sum(axis=0, dtype=np.int64)
+
+    # Flip to least significant first, and only keep places up to the widest record
+    return [int(c) for c in totals[::-1][:width]]
 
 """
 Process records for energy usage
@@ -38,8 +68,11 @@ We're deriving gamma and epsilon values based on
 which places were mostly high bits or mostly low bits.
 """
 def calculate_energy_usage(records):
-    # Determine high bit counts by place in input
-    high_bit_counts = count_high_bits(records)
+    # Determine high bit counts by place in input, in bulk for large inputs
+    if len(records) > VECTORIZED_RECORD_COUNT:
+        high_bit_counts = count_high_bits_packed(*pack_records(records))
+    else:
+        high_bit_counts = count_high_bits(records)
 
     # Determine gamma and epsilon bits
     #   Not doing this bitwise so we get padding as needed
@@ -97,6 +130,67 @@ def get_rating(records, use_majority):
     # Done, return the single remaining record
     return ratings[0]
 
+class RecordIndex:
+    """
+    Sorted index over a fixed set of records for repeated rating queries.
+
+    Records sharing the same leading bits are contiguous once sorted,
+    so each step of a rating reduction just bisects the current range
+    at the next place instead of filtering and copying the records.
+    """
+
+    def __init__(self, records):
+        # Determine the width from the widest record, as count_high_bits does
+        self._width = max(records, default=0).bit_length()
+
+        # Use a compact array when records fit in 64 bits, otherwise a plain sorted list
+        if self._width <= 64:
+            self._sorted = np.sort(np.array(records, dtype=np.uint64))
+        else:
+            self._sorted = sorted(records)
+
+    def __len__(self):
+        return len(self._sorted)
+
+    def get_rating(self, use_majority):
+        """
+        Reduce the records to a single rating by walking bit prefixes from the
+        most significant place, keeping the majority or minority bit in each
+        place the same way get_rating does.
+        """
+
+        # Track the range of sorted records sharing the current prefix
+        low = 0
+        high = len(self._sorted)
+        prefix = 0
+        for place in reversed(range(self._width)):
+            if high - low <= 1:
+                break
+
+            # Records with a high bit in this place sort after the prefix with that bit set
+            mask = 1 << place
+            split = bisect_left(self._sorted, prefix | mask, low, high)
+            low_bit_count = split - low
+            high_bit_count = high - split
+
+            # Ties go to the high bit for the majority, and the low bit for the minority
+            use_high_bit = (high_bit_count >= low_bit_count) == use_majority
+
+            # If every record has the same bit in this place there is nothing to split
+            if not high_bit_count:
+                use_high_bit = False
+            elif not low_bit_count:
+                use_high_bit = True
+
+            if use_high_bit:
+                low = split
+                prefix |= mask
+            else:
+                high = split
+
+        # Done, return the first remaining record
+        return int(self._sorted[low])
+
 """
 Process records for life support
 
@@ -105,9 +199,10 @@ reverse whether we're looking for the majority or minority
 bits in each place in the remaining records.
 """
 def calculate_life_rating(records):
-    # Find oxygen generator and CO2 scrubber ratings
-    oxygen = get_rating(records, use_majority=True)
-    co2 = get_rating(records, use_majority=False)
+    # Index the records once, then find oxygen generator and CO2 scrubber ratings
+    index = records if isinstance(records, RecordIndex) else RecordIndex(records)
+    oxygen = index.get_rating(use_majority=True)
+    co2 = index.get_rating(use_majority=False)
 
     # Done, return final life support rating
     return (oxygen, co2, oxygen*co2)
@@ -1,6 +1,12 @@
 #!/usr/bin/env python3
 
+from bisect import bisect_left, bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 import math
+import numpy as np
+import os
 import sys
 
 class Bingo:
@@ -10,7 +16,10 @@ class Bingo:
     this game of bingo.
     """
 
-    def __init__(self, input_file):
+    def __init__(self, input_file, board_type = None):
+        # Use the original board representation unless a compact one is requested
+        board_type = board_type or Board
+
         # Read the called numbers, comma-separated on the first line
         input_lines = [l.strip() for l in input_file]
         self._called = [int(n) for n in input_lines[0].split(",")]
@@ -21,11 +30,19 @@ class Bingo:
         for input_line in input_lines[1:]:
             if not input_line:
                 if board_lines:
-                    self._boards.append(Board(board_lines))
+                    self._boards.append(board_type(board_lines))
                 board_lines = []
             else:
                 board_lines.append(input_line)
 
+        # The inverted index from numbers to board cells is only built once a number is called
+        self._cells_by_number = None
+
+        # Closed-form win turns and scores, and the ranking of winners, are computed on demand
+        self._solution = None
+        self._ranking = None
+        self._ranking_turns = None
+
     def __str__(self):
         # Reverse the read and format the called numbers and then the boards
         output = []
@@ -44,6 +61,25 @@ class Bingo:
         for board in self._boards:
             board.reset()
 
+    def call(self, number):
+        """
+        Call a number on only the boards holding it, returning any boards that
+        completed a row or column with it, in game order.
+        """
+
+        # Build a game-wide inverted index from numbers to the board cells holding them on first use
+        if self._cells_by_number is None:
+            self._cells_by_number = {}
+            for board in self._boards:
+                for (number_on_board, i, j) in board.get_cells():
+                    self._cells_by_number.setdefault(number_on_board, []).append((board, i, j))
+
+        winners = []
+        for (board, i, j) in self._cells_by_number.get(number, []):
+            if board.mark(i, j, number):
+                winners.append(board)
+        return winners
+
     def find_winning_board(self):
         """
         Find the first board to win after a called number.
@@ -52,13 +88,12 @@ class Bingo:
         # Reset the board state in case we're running this game multiple times
         self.reset()
 
-        # Call each number in turn, updating each board in turn
+        # Call each number in turn, updating only the boards holding it
         for number in self._called:
-            for board in self._boards:
-                win = board.call(number)
-                if win:
-                    # This board just won, so we can stop playing
-                    return board
+            winners = self.call(number)
+            if winners:
+                # This board just won, so we can stop playing
+                return winners[0]
 
         # We called all the numbers but no board won
         return None
@@ -74,19 +109,103 @@ class Bingo:
         # Track whether a board has won
         winning_boards = set([])
 
-        # Call each number in turn, updating each board in turn
+        # Call each number in turn, updating only the boards holding it
         for number in self._called:
-            for board in self._boards:
-                win = board.call(number)
-                if win:
-                    winning_boards.add(board)
-                    if len(winning_boards) == len(self._boards):
-                        # All of the boards are winners and this was the last winner, so we can stop playing
-                        return board
+            for board in self.call(number):
+                winning_boards.add(board)
+                if len(winning_boards) == len(self._boards):
+                    # All of the boards are winners and this was the last winner, so we can stop playing
+                    return board
 
         # We called all the numbers but either the last winner wasn't the last board or no board won
         return None
 
+    def generate_winners(self):
+        """
+        Play the game once, lazily yielding the call turn, board, and score
+        for each board as it first wins, in finishing order. Boards winning
+        on the same call are yielded in game order.
+        """
+
+        # Reset the board state in case we're running this game multiple times
+        self.reset()
+
+        # Track which boards have already won so each is yielded once
+        winning_boards = set([])
+        for turn, number in enumerate(self._called):
+            for board in self.call(number):
+                if board not in winning_boards:
+                    winning_boards.add(board)
+
+                    # Score now, since later calls keep marking the board
+                    yield (turn, board, board.get_score())
+
+            if len(winning_boards) == len(self._boards):
+                # Every board has won, so there's nothing left to play for
+                return
+
+    def rank_winners(self):
+        """
+        Get the complete finishing order as a list of (turn, board, score)
+        tuples from a single play of the game. First, last, and top-k winners
+        are then just indexes and slices, and winners at a given turn can be
+        found with find_winners_at_turn.
+        """
+
+        # Keep the ranking and its turns for later queries
+        self._ranking = list(self.generate_winners())
+        self._ranking_turns = [t for (t, _, _) in self._ranking]
+        return self._ranking
+
+    def find_winners_at_turn(self, turn):
+        """
+        Find the (turn, board, score) tuples of boards that won on the
+        specified call turn, ranking the winners first if needed.
+        """
+
+        if self._ranking is None:
+            self.rank_winners()
+
+        # Rankings are sorted by turn so bisect by turn on both sides
+        return self._ranking[bisect_left(self._ranking_turns, turn):bisect_right(self._ranking_turns, turn)]
+
+    def solve(self):
+        """
+        Compute every board's win turn and unmarked sum directly, without playing.
+
+        A cell is marked at the turn its number is first called, a row or
+        column completes at the latest turn among its cells, and a board wins
+        at the earliest turn among its rows and columns. Boards that never win
+        get a win turn equal to the number of calls.
+        """
+
+        if self._solution is None:
+            size = len(self._boards[0].get_rows()) if self._boards else 1
+            boards = np.array([board.get_rows() for board in self._boards], dtype=np.int64).reshape(-1, size, size)
+            self._solution = solve_boards(boards, index_calls(self._called))
+
+        return self._solution
+
+    def find_ranked_winning_board(self, rank):
+        """
+        Find the board finishing in the specified place among the boards that
+        win, indexed from 0 for the first winner with negative ranks counting
+        back from the last, along with its score. Boards winning on the same
+        call are ordered as they are in the game.
+        """
+
+        (win_turns, unmarked) = self.solve()
+
+        # Order the winning boards by win turn, keeping game order for ties
+        winners = np.flatnonzero(win_turns < len(self._called))
+        ranked = winners[np.argsort(win_turns[winners], kind="stable")]
+        index = ranked[rank]
+
+        # Score the same way as Board.get_score
+        unmarked_sum = int(unmarked[index])
+        last_call = self._called[win_turns[index]]
+        return (self._boards[index], (unmarked_sum, last_call, unmarked_sum*last_call))
+
 class Board:
     """
     Stores the loaded state of one bingo card and tracks matching number state
@@ -108,6 +227,21 @@ class Board:
         # Initialize the marked state tracking
         self.reset()
 
+    def get_rows(self):
+        """
+        Get the board numbers as a list of rows.
+        """
+
+        return self._board
+
+    def get_cells(self):
+        """
+        Generate each number on the board with its row and column coordinates.
+        """
+
+        for (number, (i, j)) in self._lookup_by_number.items():
+            yield (number, i, j)
+
     def __str__(self):
         # Determine padding based on largest possible value
         padding = int(math.ceil(math.log(self._size**2, 10))) + 1
@@ -156,19 +290,34 @@ class Board:
         if number in self._lookup_by_number:
             # Get the coordinates holding this value from our reverse lookup dictionary and update state
             (i, j) = self._lookup_by_number[number]
-            self._marked[i][j] = True
-            self._streaks["rows"][i] += 1
-            self._streaks["columns"][j] += 1
-            if i == j:
-                # Update the upper left to lower right diagonal
-                self._streaks["diagonals"][0] += 1
-            elif i + j == self._size:
-                # Update the lower left to upper right diagonal
-                self._streaks["diagonals"][1] += 1
+            self.mark(i, j, number)
 
         # Check if this board has won
         return self.is_winner()
 
+    def mark(self, i, j, number):
+        """
+        Mark a known cell for a called number, returning whether its row or
+        column just became complete so only those streaks need checking.
+        """
+
+        self._last_call = number
+        if self._marked[i][j]:
+            # Already marked by an earlier call, so nothing changes
+            return False
+
+        self._marked[i][j] = True
+        self._streaks["rows"][i] += 1
+        self._streaks["columns"][j] += 1
+        if i == j:
+            # Update the upper left to lower right diagonal
+            self._streaks["diagonals"][0] += 1
+        elif i + j == self._size:
+            # Update the lower left to upper right diagonal
+            self._streaks["diagonals"][1] += 1
+
+        return self._streaks["rows"][i] == self._size or self._streaks["columns"][j] == self._size
+
     def is_winner(self, use_diagonals=False):
         """
         Helper method for more efficient win condition checking.
@@ -200,6 +349,281 @@ class Board:
                     unmarked_sum += number
         return (unmarked_sum, self._last_call, unmarked_sum*self._last_call)
 
+@lru_cache(maxsize=None)
+def get_line_masks(size):
+    """
+    Bitmasks over row-major cell bits for each row, column, and diagonal of
+    a square board, shared between all compact boards of the same size.
+    """
+
+    rows = tuple(((1 << size) - 1) << (i * size) for i in range(size))
+    columns = tuple(sum(1 << (i * size + j) for i in range(size)) for j in range(size))
+    diagonals = (
+        sum(1 << (i * size + i) for i in range(size)),
+        sum(1 << (i * size + size - 1 - i) for i in range(size)))
+    return (rows, columns, diagonals)
+
+class CompactBoard:
+    """
+    Memory-lean alternative to Board for games with very many boards.
+
+    Numbers are kept in a flat row-major tuple and marked cells in a single
+    integer bitmask, with the unmarked sum maintained as numbers are called,
+    so calling a number and scoring are both constant time.
+    """
+
+    __slots__ = ("_numbers", "_size", "_cells", "_masks", "_marked", "_unmarked_sum", "_last_call", "_won")
+
+    def __init__(self, board_lines):
+        # Parse the board grid of N values per N lines into a flat tuple
+        rows = [[int(n) for n in l.split()] for l in board_lines]
+        self._numbers = tuple(n for row in rows for n in row)
+        self._size = len(rows)
+
+        # Create a fast reverse lookup dictionary from values to row-major cell bits
+        self._cells = {}
+        for (cell, number) in enumerate(self._numbers):
+            self._cells[number] = cell
+        self._masks = get_line_masks(self._size)
+
+        # Initialize the marked state tracking
+        self.reset()
+
+    def __str__(self):
+        # Determine padding based on largest possible value
+        padding = int(math.ceil(math.log(self._size**2, 10))) + 1
+
+        # Reverse the read format and space out the boards, bolding marked numbers
+        output = []
+        for (cell, number) in enumerate(self._numbers):
+            if self._marked >> cell & 1:
+                output.append('\033[1m' + str(number).rjust(padding, " ") + '\033[0m')
+            else:
+                output.append(str(number).rjust(padding, " "))
+            if cell % self._size == self._size - 1:
+                output.append("\n")
+        return "".join(output)
+
+    def get_rows(self):
+        """
+        Get the board numbers as a list of rows.
+        """
+
+        return [list(self._numbers[i:i+self._size]) for i in range(0, len(self._numbers), self._size)]
+
+    def get_cells(self):
+        """
+        Generate each number on the board with its row and column coordinates.
+        """
+
+        for (number, cell) in self._cells.items():
+            yield (number, cell // self._size, cell % self._size)
+
+    def reset(self):
+        """
+        Reset the board state by clearing the marked cells.
+        """
+
+        self._marked = 0
+        self._unmarked_sum = sum(self._numbers)
+        self._last_call = None
+        self._won = False
+
+    def call(self, number):
+        """
+        Update the marked state when a number is called
+        """
+
+        self._last_call = number
+        if number in self._cells:
+            cell = self._cells[number]
+            self.mark(cell // self._size, cell % self._size, number)
+        return self._won
+
+    def mark(self, i, j, number):
+        """
+        Mark a known cell for a called number, returning whether its row or
+        column just became complete.
+        """
+
+        self._last_call = number
+        bit = 1 << (i * self._size + j)
+        if self._marked & bit:
+            # Already marked by an earlier call, so nothing changes
+            return False
+
+        self._marked |= bit
+        self._unmarked_sum -= number
+
+        # Only the row and column holding this cell can have just completed
+        (rows, columns, _) = self._masks
+        completed = (self._marked & rows[i]) == rows[i] or (self._marked & columns[j]) == columns[j]
+        self._won = self._won or completed
+        return completed
+
+    def is_winner(self, use_diagonals=False):
+        """
+        Check for a completed row or column, and optionally diagonal.
+        """
+
+        if self._won:
+            return True
+        if use_diagonals:
+            return any((self._marked & mask) == mask for mask in self._masks[2])
+        return False
+
+    def get_score(self):
+        """
+        Calculate a board's score based on the rules where it's the product of
+        the last number called and the sum of any unmarked entries on the board
+        """
+
+        return (self._unmarked_sum, self._last_call, self._unmarked_sum*self._last_call)
+
+def read_called(input_file):
+    """
+    Read the called numbers from the comma-separated first line of a game.
+    """
+
+    return [int(n) for n in input_file.readline().strip().split(",")]
+
+def generate_board_lines(input_file):
+    """
+    Lazily generate the lines of each board from the rest of a game after
+    the called numbers, so boards never all have to be in memory at once.
+    """
+
+    board_lines = []
+    for input_line in input_file:
+        input_line = input_line.strip()
+        if not input_line:
+            if board_lines:
+                yield board_lines
+            board_lines = []
+        else:
+            board_lines.append(input_line)
+
+    # The last board may not be followed by an empty line
+    if board_lines:
+        yield board_lines
+
+def generate_boards(input_file, board_type = None):
+    """
+    Lazily generate parsed boards from the rest of a game after the called numbers.
+    """
+
+    board_type = board_type or Board
+    for board_lines in generate_board_lines(input_file):
+        yield board_type(board_lines)
+
+def index_calls(called):
+    """
+    Index the called numbers for solve_boards, as the sorted distinct numbers,
+    the turn each is first called, and the turn count standing for never.
+    """
+
+    (numbers, first_turns) = np.unique(np.array(called, dtype=np.int64), return_index=True)
+    return (numbers, first_turns, len(called))
+
+def solve_boards(boards, call_index):
+    """
+    Compute the win turn and unmarked sum at that turn for every board in
+    an array of boards shaped (boards, size, size), given the index of the
+    called numbers from index_calls, without playing.
+
+    A cell is marked at the turn its number is first called, a row or
+    column completes at the latest turn among its cells, and a board wins
+    at the earliest turn among its rows and columns. Boards that never win
+    get a win turn equal to the number of calls.
+    """
+
+    # Look up the marking turn for every cell of every board at once by
+    # searching the sorted called numbers, so memory doesn't depend on the values
+    (numbers, first_turns, never) = call_index
+    positions = np.searchsorted(numbers, boards).clip(max=max(len(numbers) - 1, 0))
+    if len(numbers):
+        marked_turns = np.where(numbers[positions] == boards, first_turns[positions], never)
+    else:
+        marked_turns = np.full(boards.shape, never, dtype=np.int64)
+    win_turns = np.minimum(marked_turns.max(axis=2).min(axis=1), marked_turns.max(axis=1).min(axis=1))
+
+    # Sum the cells still unmarked at each board's win turn
+    unmarked = np.where(marked_turns > win_turns[:, None, None], boards, 0).sum(axis=(1, 2))
+    return (win_turns, unmarked)
+
+# Called numbers broadcast once to each shard worker process
+_shard_called = None
+_shard_call_index = None
+
+def _init_shard_worker(called):
+    global _shard_called, _shard_call_index
+    _shard_called = called
+    _shard_call_index = index_calls(called)
+
+def _score_shard(first_index, shard):
+    # Solve the shard's boards in closed form
+    rows = [[[int(n) for n in l.split()] for l in board_lines] for board_lines in shard]
+    (win_turns, unmarked) = solve_boards(np.array(rows, dtype=np.int64), _shard_call_index)
+    winners = np.flatnonzero(win_turns < len(_shard_called))
+    if not len(winners):
+        return (None, None)
+
+    # Ties go to the earlier board for the first winner and the later board for the last
+    earliest = winners[np.argmin(win_turns[winners])]
+    latest = winners[len(winners) - 1 - np.argmax(win_turns[winners][::-1])]
+
+    return tuple(_get_shard_winner(first_index + int(i), int(win_turns[i]), int(unmarked[i])) for i in (earliest, latest))
+
+def _get_shard_winner(index, win_turn, unmarked_sum):
+    # Score the same way as Board.get_score at the win turn
+    last_call = _shard_called[win_turn]
+    return (win_turn, index, (unmarked_sum, last_call, unmarked_sum*last_call))
+
+def _merge_winners(winners, shard_winners):
+    # Keep the earliest first winner and latest last winner, breaking ties by board index
+    (first, last) = winners
+    (earliest, latest) = shard_winners
+    if earliest is not None and (first is None or earliest[:2] < first[:2]):
+        first = earliest
+    if latest is not None and (last is None or latest[:2] > last[:2]):
+        last = latest
+    return (first, last)
+
+def play_sharded(input_path, shard_size = 10000, workers = None):
+    """
+    Find the first and last winners of a game too large to hold in memory.
+
+    Streams boards from the file in shards that are scored on worker
+    processes, which only send back their earliest and latest winners.
+    Returns the first and last winners as (turn, board index, score)
+    tuples, or None when no board wins.
+    """
+
+    with open(input_path) as input_file, ProcessPoolExecutor(max_workers=workers,
+            initializer=_init_shard_worker, initargs=(read_called(input_file),)) as executor:
+        # Keep a bounded number of shards in flight so reading doesn't outpace scoring
+        pending = deque()
+        max_pending = 2 * (workers or os.cpu_count() or 1)
+        winners = (None, None)
+
+        shard = []
+        board_count = 0
+        for board_lines in generate_board_lines(input_file):
+            shard.append(board_lines)
+            if len(shard) == shard_size:
+                pending.append(executor.submit(_score_shard, board_count, shard))
+                board_count += len(shard)
+                shard = []
+                if len(pending) >= max_pending:
+                    winners = _merge_winners(winners, pending.popleft().result())
+        if shard:
+            pending.append(executor.submit(_score_shard, board_count, shard))
+        while pending:
+            winners = _merge_winners(winners, pending.popleft().result())
+
+    # Done, return the merged earliest and latest winners
+    return winners
+
 def main(input_path):
     """
     Entry point for puzzle day 2021.12.04
@@ -210,15 +634,20 @@ def main(input_path):
         # Initialize the game state from the input
         bingo = Bingo(input_file)
 
-        # Calculate and print results
-        winner = bingo.find_winning_board()
+        # Play the game once, printing the first winner before later calls mark it further
+        winners = bingo.generate_winners()
+        (_, winner, score) = next(winners)
         print("Winning board:")
         print(winner)
-        print("Final score: %d * %d = %d" % winner.get_score())
-        last_winner = bingo.find_last_winning_board()
+        print("Final score: %d * %d = %d" % score)
+
+        # Keep playing to the last winner
+        (_, last_winner, last_score) = (None, winner, score)
+        for (_, last_winner, last_score) in winners:
+            pass
         print("Last winning board:")
         print(last_winner)
-        print("Final score: %d * %d = %d" % last_winner.get_score())
+        print("Final score: %d * %d = %d" % last_score)
 
 if __name__ == "__main__":
     main(sys.argv[1])
@@ -1,7 +1,11 @@
 #!/usr/bin/env python3
 
-from collections import Counter
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
 import math
+import numpy as np
+import os
 import sys
 
 class Canvas:
@@ -15,9 +19,16 @@ class Canvas:
 
     def __str__(self):
         # Reverse the read and format the lines
-        output = [str(l) for l in self._lines]
+        output = [str(l) for l in self.get_lines()]
         return "\n".join(output)
 
+    def get_lines(self):
+        """
+        Get the lines on the canvas.
+        """
+
+        return self._lines
+
     def count_overlap(self, threshold, use_diagonals):
         """
         Core puzzle functionality: count the number of lines
@@ -27,7 +38,7 @@ class Canvas:
 
         # Accumulate count using specialized dictionary by point
         grid = Counter()
-        for line in self._lines:
+        for line in self.get_lines():
             if line.is_cardinal() or use_diagonals:
                 grid.update(line.get_points())
 
@@ -38,6 +49,378 @@ class Canvas:
                 overlap += 1
         return overlap
 
+    def get_coordinates(self, use_diagonals):
+        """
+        Get the endpoints of the considered lines as four integer arrays of
+        start x, start y, end x, and end y values.
+        """
+
+        lines = [l for l in self.get_lines() if l.is_cardinal() or use_diagonals]
+        coordinates = np.array([l.get_endpoints() for l in lines], dtype=np.int64)
+        return tuple(coordinates.reshape(-1, 4).T)
+
+    def count_overlap_dense(self, threshold, use_diagonals, batch_size = 1 << 20):
+        """
+        Same as count_overlap, but rasterizes the lines into a dense integer
+        grid covering their bounding box using bulk array operations.
+        """
+
+        (x1, y1, x2, y2) = self.get_coordinates(use_diagonals)
+        if not len(x1):
+            return 0
+
+        # Rasterize into a grid covering the bounding box
+        x_min = int(min(x1.min(), x2.min()))
+        y_min = int(min(y1.min(), y2.min()))
+        width = int(max(x1.max(), x2.max())) - x_min + 1
+        height = int(max(y1.max(), y2.max())) - y_min + 1
+        grid = rasterize(x1, y1, x2, y2, x_min, y_min, width, height, batch_size)
+
+        # Count the number of counts above the threshold
+        return int(np.count_nonzero(grid >= threshold))
+
+    def count_overlap_tiled(self, threshold, use_diagonals, tile_size = 4096, workers = None):
+        """
+        Same as count_overlap, but splits the canvas into square tiles that
+        are rasterized independently on a pool of processes, so only a few
+        tile grids are in memory at once.
+        """
+
+        (x1, y1, x2, y2) = self.get_coordinates(use_diagonals)
+
+        # Bucket the lines by the tiles they actually pass through
+        buckets = defaultdict(list)
+        for (index, (ax, ay, bx, by)) in enumerate(zip(x1.tolist(), y1.tolist(), x2.tolist(), y2.tolist())):
+            for tile in get_tiles(ax, ay, bx, by, tile_size):
+                buckets[tile].append(index)
+
+        # Rasterize each tile on the pool, keeping a bounded number of tiles in flight
+        overlap = 0
+        pending = deque()
+        max_pending = 2 * (workers or os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for ((tile_x, tile_y), indexes) in buckets.items():
+                pending.append(executor.submit(count_tile_overlap,
+                    x1[indexes], y1[indexes], x2[indexes], y2[indexes],
+                    tile_x * tile_size, tile_y * tile_size, tile_size, threshold))
+                if len(pending) >= max_pending:
+                    overlap += pending.popleft().result()
+            while pending:
+                overlap += pending.popleft().result()
+
+        # Done, return the total across all tiles
+        return overlap
+
+    def count_overlap_sweep(self, threshold, use_diagonals):
+        """
+        Same as count_overlap, but counts analytically so the cost depends on
+        the number of lines and crossings rather than on their lengths.
+
+        Lines are grouped into families of parallel lines (horizontal,
+        vertical, and the two diagonals) and collinear lines are merged into
+        runs of constant count. Points on a single run count if the run does,
+        and the crossings between runs of different families, found with a
+        sweep-line, correct for points where the run counts combine.
+        """
+
+        # Group the lines into runs by family; diagonals are keyed by x-y or x+y and span x
+        (x1, y1, x2, y2) = [c.tolist() for c in self.get_coordinates(use_diagonals)]
+        intervals = defaultdict(list)
+        for (ax, ay, bx, by) in zip(x1, y1, x2, y2):
+            if ay == by:
+                intervals[("horizontal", ay)].append((min(ax, bx), max(ax, bx)))
+            elif ax == bx:
+                intervals[("vertical", ax)].append((min(ay, by), max(ay, by)))
+            elif (bx - ax) == (by - ay):
+                intervals[("diagonal", ax - ay)].append((min(ax, bx), max(ax, bx)))
+            else:
+                intervals[("antidiagonal", ax + ay)].append((min(ax, bx), max(ax, bx)))
+        runs = defaultdict(list)
+        for ((family, key), family_intervals) in intervals.items():
+            runs[family].extend((key, low, high, count) for (low, high, count) in merge_runs(family_intervals))
+
+        # Every point on a run counts once if the run alone reaches the threshold
+        overlap = sum(high - low + 1 for family_runs in runs.values() for (_, low, high, count) in family_runs if count >= threshold)
+
+        # Collect the run counts from each family at points where runs of different families cross
+        crossings = defaultdict(dict)
+        for (family, other_family, horizontal, vertical, to_point) in _crossing_frames:
+            horizontals = [horizontal(*r) + (r[3],) for r in runs[family]]
+            verticals = [vertical(*r) + (r[3],) for r in runs[other_family]]
+            for (u, v, count, other_count) in find_crossings(horizontals, verticals):
+                point = to_point(u, v)
+                if point is not None:
+                    crossings[point][family] = count
+                    crossings[point][other_family] = other_count
+
+        # Replace the per-run counts at crossings with whether the combined count reaches the threshold
+        for counts in crossings.values():
+            overlap += (sum(counts.values()) >= threshold) - sum(1 for c in counts.values() if c >= threshold)
+        return overlap
+
+class IncrementalCanvas(Canvas):
+    """
+    A Canvas that supports adding and removing lines while keeping the
+    overlap counts for a fixed threshold up to date, for both the
+    cardinal-only and with-diagonals views, so each edit only costs time
+    proportional to the length of the edited line.
+    """
+
+    def __init__(self, input_file, threshold = 2):
+        # Read the lines as usual, then add each one to the running counts
+        self._threshold = threshold
+        self._grids = {False: Counter(), True: Counter()}
+        self._overlap = {False: 0, True: 0}
+
+        # Store lines by endpoints so removal doesn't scan the whole canvas
+        self._lines_by_endpoints = {}
+        for input_line in input_file:
+            self.add_line(input_line)
+
+    def get_lines(self):
+        """
+        Generate the lines on the canvas.
+        """
+
+        for lines in self._lines_by_endpoints.values():
+            yield from lines
+
+    def _update(self, line, change):
+        # Only lines that are cardinal appear in the cardinal-only view
+        views = (False, True) if line.is_cardinal() else (True,)
+        for point in line.get_points():
+            for use_diagonals in views:
+                grid = self._grids[use_diagonals]
+
+                # Track crossings of the threshold in either direction
+                if change < 0 and grid[point] == self._threshold:
+                    self._overlap[use_diagonals] -= 1
+                grid[point] += change
+                if change > 0 and grid[point] == self._threshold:
+                    self._overlap[use_diagonals] += 1
+                if not grid[point]:
+                    del grid[point]
+
+    def add_line(self, line):
+        """
+        Add a line, given as a Line or in the input format.
+        """
+
+        if not isinstance(line, Line):
+            line = Line(line)
+        self._lines_by_endpoints.setdefault(line.get_endpoints(), []).append(line)
+        self._update(line, 1)
+        return line
+
+    def remove_line(self, line):
+        """
+        Remove a line, given as a Line or in the input format, matching by endpoints.
+        """
+
+        if not isinstance(line, Line):
+            line = Line(line)
+        endpoints = line.get_endpoints()
+        if endpoints not in self._lines_by_endpoints:
+            raise ValueError("Line %s is not on the canvas" % line)
+
+        # Drop the most recently added matching line, and the endpoints once none are left
+        lines = self._lines_by_endpoints[endpoints]
+        existing = lines.pop()
+        if not lines:
+            del self._lines_by_endpoints[endpoints]
+        self._update(existing, -1)
+        return existing
+
+    def count_overlap(self, threshold, use_diagonals):
+        """
+        Use the running count for the tracked threshold, otherwise count from scratch.
+        """
+
+        if threshold == self._threshold:
+            return self._overlap[use_diagonals]
+        return super().count_overlap(threshold, use_diagonals)
+
+class ColumnarCanvas(Canvas):
+    """
+    A Canvas backed by a LineSet instead of Line objects, for maps with
+    very many lines. Every overlap counting method works directly on the
+    coordinate arrays, with count_overlap using the sweep-line counter.
+    """
+
+    def __init__(self, input_file, chunk_size = 1 << 24):
+        # Bulk parse the lines into columnar storage
+        self._line_set = LineSet.read(input_file, chunk_size)
+
+    def __str__(self):
+        return str(self._line_set)
+
+    def count_overlap(self, threshold, use_diagonals):
+        """
+        Core puzzle functionality, counted without enumerating points.
+        """
+
+        return self.count_overlap_sweep(threshold, use_diagonals)
+
+    def get_coordinates(self, use_diagonals):
+        """
+        Get the endpoints of the considered lines as four integer arrays of
+        start x, start y, end x, and end y values.
+        """
+
+        return self._line_set.get_coordinates(use_diagonals)
+
+def rasterize(x1, y1, x2, y2, x_min, y_min, width, height, batch_size = 1 << 20):
+    """
+    Rasterize horizontal, vertical, and 45° diagonal lines given as endpoint
+    arrays into a compact grid of counts for the rectangle at the specified
+    origin and size, flattened row by row. Points outside are clipped.
+    """
+
+    # Size the counts to the most lines that could cross one point
+    count_type = np.uint8 if len(x1) < 2**8 else np.uint16 if len(x1) < 2**16 else np.uint32
+    grid = np.zeros(width * height, dtype=count_type)
+
+    # Each line steps one unit along x, y, or both from its start, inclusive of its end
+    x_step = np.sign(x2 - x1)
+    y_step = np.sign(y2 - y1)
+    lengths = np.maximum(np.abs(x2 - x1), np.abs(y2 - y1)) + 1
+
+    # Clip the range of steps along each line to those inside the rectangle on both axes
+    first_steps = np.zeros_like(lengths)
+    last_steps = lengths - 1
+    for (start, step, low, high) in ((x1, x_step, x_min, x_min + width - 1), (y1, y_step, y_min, y_min + height - 1)):
+        inside = (start >= low) & (start <= high)
+        first_steps = np.maximum(first_steps, np.where(step > 0, low - start, np.where(step < 0, start - high, np.where(inside, 0, lengths))))
+        last_steps = np.minimum(last_steps, np.where(step > 0, high - start, np.where(step < 0, start - low, np.where(inside, lengths - 1, -1))))
+    x1 = x1 + first_steps * x_step
+    y1 = y1 + first_steps * y_step
+    lengths = np.maximum(last_steps - first_steps + 1, 0)
+
+    # Rasterize batches of lines totalling at most the batch size in points, but at least one line
+    line_ends = np.cumsum(lengths)
+    batch_start = 0
+    while batch_start < len(x1):
+        batch_end = int(np.searchsorted(line_ends, line_ends[batch_start] - lengths[batch_start] + batch_size, side="right"))
+        batch_end = max(batch_end, batch_start + 1)
+        batch = slice(batch_start, batch_end)
+        line_indexes = np.repeat(np.arange(batch_start, batch_end), lengths[batch])
+        line_offsets = np.arange(len(line_indexes)) - np.repeat(np.cumsum(lengths[batch]) - lengths[batch], lengths[batch])
+        xs = x1[line_indexes] + line_offsets * x_step[line_indexes] - x_min
+        ys = y1[line_indexes] + line_offsets * y_step[line_indexes] - y_min
+
+        # Scatter-add every point of the batch into the grid at once
+        np.add.at(grid, ys * width + xs, 1)
+        batch_start = batch_end
+
+    return grid
+
+def get_tiles(x1, y1, x2, y2, tile_size):
+    """
+    Generate the (column, row) coordinates of the square tiles a line passes through.
+    """
+
+    # Walk the rows of tiles the line spans, finding the x range of the line within each
+    x_per_y = 0 if y1 == y2 else (x2 - x1) // (y2 - y1)
+    for tile_y in range(min(y1, y2) // tile_size, max(y1, y2) // tile_size + 1):
+        if y1 == y2:
+            (x_low, x_high) = (min(x1, x2), max(x1, x2))
+        else:
+            y_low = max(min(y1, y2), tile_y * tile_size)
+            y_high = min(max(y1, y2), (tile_y + 1) * tile_size - 1)
+            (x_low, x_high) = sorted((x1 + x_per_y * (y_low - y1), x1 + x_per_y * (y_high - y1)))
+        for tile_x in range(x_low // tile_size, x_high // tile_size + 1):
+            yield (tile_x, tile_y)
+
+def count_tile_overlap(x1, y1, x2, y2, x_min, y_min, tile_size, threshold):
+    """
+    Count the points within one tile crossed by at least the threshold number of lines.
+    """
+
+    grid = rasterize(x1, y1, x2, y2, x_min, y_min, tile_size, tile_size)
+    return int(np.count_nonzero(grid >= threshold))
+
+def merge_runs(intervals):
+    """
+    Merge possibly overlapping inclusive integer intervals on one line into
+    disjoint runs of constant count, as (low, high, count) tuples.
+    """
+
+    # Sweep over interval boundaries, tracking how many intervals are open
+    changes = Counter()
+    for (low, high) in intervals:
+        changes[low] += 1
+        changes[high + 1] -= 1
+    runs = []
+    count = 0
+    boundaries = sorted(changes)
+    for (boundary, next_boundary) in zip(boundaries, boundaries[1:]):
+        count += changes[boundary]
+        if count > 0:
+            runs.append((boundary, next_boundary - 1, count))
+    return runs
+
+def find_crossings(horizontals, verticals):
+    """
+    Find the integer points where horizontal segments (v, u_low, u_high, payload)
+    cross vertical segments (u, v_low, v_high, payload), as (u, v, horizontal
+    payload, vertical payload) tuples. Horizontals must not overlap each other.
+    """
+
+    # Sweep across u, removing ended horizontals, then adding starting ones, then querying verticals
+    events = []
+    for (v, u_low, u_high, payload) in horizontals:
+        events.append((u_low, 1, v, payload))
+        events.append((u_high + 1, 0, v, payload))
+    for (u, v_low, v_high, payload) in verticals:
+        events.append((u, 2, (v_low, v_high), payload))
+    events.sort(key=lambda e: (e[0], e[1]))
+
+    # Active horizontals are kept sorted by v, with payloads alongside
+    active = []
+    active_payloads = {}
+    for (u, kind, v, payload) in events:
+        if kind == 0:
+            del active[bisect_left(active, v)]
+            del active_payloads[v]
+        elif kind == 1:
+            insort(active, v)
+            active_payloads[v] = payload
+        else:
+            (v_low, v_high) = v
+            for crossing_v in active[bisect_left(active, v_low):bisect_right(active, v_high)]:
+                yield (u, crossing_v, active_payloads[crossing_v], payload)
+
+# For each pair of line families, coordinates (u, v) in which runs of the
+# first are horizontal and runs of the second are vertical, as functions of
+# a (key, low, high) run giving (v, u_low, u_high) or (u, v_low, v_high),
+# along with the inverse mapping from a crossing back to an integer point
+_crossing_frames = [
+    ("horizontal", "vertical",
+        lambda y, x_low, x_high, _: (y, x_low, x_high),
+        lambda x, y_low, y_high, _: (x, y_low, y_high),
+        lambda u, v: (u, v)),
+    ("horizontal", "diagonal",
+        lambda y, x_low, x_high, _: (y, x_low - y, x_high - y),
+        lambda c, x_low, x_high, _: (c, x_low - c, x_high - c),
+        lambda u, v: (u + v, v)),
+    ("horizontal", "antidiagonal",
+        lambda y, x_low, x_high, _: (y, x_low + y, x_high + y),
+        lambda d, x_low, x_high, _: (d, d - x_high, d - x_low),
+        lambda u, v: (u - v, v)),
+    ("diagonal", "vertical",
+        lambda c, x_low, x_high, _: (c, x_low, x_high),
+        lambda x, y_low, y_high, _: (x, x - y_high, x - y_low),
+        lambda u, v: (u, u - v)),
+    ("antidiagonal", "vertical",
+        lambda d, x_low, x_high, _: (d, x_low, x_high),
+        lambda x, y_low, y_high, _: (x, x + y_low, x + y_high),
+        lambda u, v: (u, v - u)),
+    ("antidiagonal", "diagonal",
+        lambda d, x_low, x_high, _: (d, 2*x_low - d, 2*x_high - d),
+        lambda c, x_low, x_high, _: (c, 2*x_low - c, 2*x_high - c),
+        lambda u, v: ((u + v) // 2, (v - u) // 2) if (u + v) % 2 == 0 else None),
+]
+
 class Line:
     """
     A 2D line segment with inclusive start and end points.
@@ -53,6 +436,13 @@ class Line:
         # Reverse the read and format the start and end points
         return "%s -> %s" % (self._start, self._end)
 
+    def get_endpoints(self):
+        """
+        Get the start and end coordinates as a tuple of start x, start y, end x, and end y.
+        """
+
+        return (self._start._x, self._start._y, self._end._x, self._end._y)
+
     def is_cardinal(self):
         """
         Check whether this line is strictly horizontal or vertical.
@@ -98,6 +488,55 @@ class Point:
 
         return (self._x - other._x, self._y - other._y)
 
+class LineSet:
+    """
+    Columnar storage for many 2D line segments: one int32 array per
+    endpoint coordinate plus a flag array marking the cardinal lines.
+    """
+
+    __slots__ = ("x1", "y1", "x2", "y2", "cardinal")
+
+    def __init__(self, x1, y1, x2, y2):
+        (self.x1, self.y1, self.x2, self.y2) = [np.asarray(c, dtype=np.int32) for c in (x1, y1, x2, y2)]
+        self.cardinal = (self.x1 == self.x2) | (self.y1 == self.y2)
+
+    def __len__(self):
+        return len(self.x1)
+
+    def __str__(self):
+        # Reverse the read and format the lines
+        return "\n".join(["%d,%d -> %d,%d" % c for c in zip(*[c.tolist() for c in (self.x1, self.y1, self.x2, self.y2)])])
+
+    @classmethod
+    def read(cls, input_file, chunk_size = 1 << 24):
+        """
+        Bulk parse lines in the input format from a binary or text file,
+        reading roughly the chunk size in bytes of whole lines at a time.
+        """
+
+        chunks = []
+        while True:
+            lines = input_file.readlines(chunk_size)
+            if not lines:
+                break
+            data = "".join(lines).encode() if isinstance(lines[0], str) else b"".join(lines)
+
+            # Reduce the arrows and commas to whitespace and convert all the numbers at once
+            tokens = data.replace(b" -> ", b" ").replace(b",", b" ").split()
+            chunks.append(np.array(tokens).astype(np.int32).reshape(-1, 4))
+
+        coordinates = np.concatenate(chunks) if chunks else np.zeros((0, 4), dtype=np.int32)
+        return cls(*coordinates.T)
+
+    def get_coordinates(self, use_diagonals):
+        """
+        Get the endpoints of the considered lines as four int64 arrays of
+        start x, start y, end x, and end y values, widened for arithmetic.
+        """
+
+        selected = slice(None) if use_diagonals else self.cardinal
+        return tuple(c[selected].astype(np.int64) for c in (self.x1, self.y1, self.x2, self.y2))
+
 def main(input_path):
     """
     Entry point for puzzle day 2021.12.05
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+from bisect import bisect_right, insort
 from collections import Counter
 import sys
 
@@ -29,6 +30,122 @@ class School:
     def get_size(self):
         return sum(self._fish.values())
 
+    def project(self, days, reset_timer = 6, newborn_timer = 8):
+        """
+        Same as reproduce, but in O(log days) steps by raising the daily
+        timer transition matrix to the number of days by repeated squaring,
+        with exact integer counts. Fish reset to the reset timer after
+        spawning, and newborns start at the newborn timer.
+        """
+
+        # The state needs one place per timer value, covering any initial timers
+        size = max([reset_timer, newborn_timer] + list(self._fish)) + 1
+        population = [self._fish.get(timer, 0) for timer in range(size)]
+
+        # Each day moves every timer down one, and timer 0 spawns into the reset and newborn timers
+        transition = [[0]*size for _ in range(size)]
+        for timer in range(1, size):
+            transition[timer-1][timer] = 1
+        transition[reset_timer][0] += 1
+        transition[newborn_timer][0] += 1
+
+        # Apply the transition raised to each set bit of the days, squaring as we go
+        while days > 0:
+            if days & 1:
+                population = [sum(a*b for (a, b) in zip(row, population)) for row in transition]
+            days >>= 1
+            if days:
+                transition = multiply_matrices(transition, transition)
+
+        self._fish = Counter({timer:count for (timer, count) in enumerate(population) if count})
+
+class RingSchool:
+    """
+    Represents a population of fish as a fixed-size ring of counts by timer,
+    so a day is just rotating the ring and adding the spawning fish back in
+    at the reset timer, and supports answering sizes for many days at once.
+    """
+
+    def __init__(self, input_file, reset_timer = 6, newborn_timer = 8):
+        # Read the single line of initial timers into counts by timer
+        fish = Counter([int(i) for line in input_file for i in line.strip().split(",")])
+        self._reset_timer = reset_timer
+        self._newborn_timer = newborn_timer
+
+        # The ring needs one place per timer value, covering any initial timers
+        size = max([reset_timer, newborn_timer] + list(fish)) + 1
+        self._counts = [fish.get(timer, 0) for timer in range(size)]
+        self._head = 0
+        self._day = 0
+
+        # Cache counts by timer at days already computed, starting with the initial state
+        self._checkpoints = {0: tuple(self._counts)}
+        self._checkpoint_days = [0]
+
+    def __str__(self):
+        # Dump the counts by timer
+        return str([(timer, count) for (timer, count) in enumerate(self.get_counts()) if count])
+
+    def get_counts(self):
+        """
+        Get the current counts indexed by timer.
+        """
+
+        return self._counts[self._head:] + self._counts[:self._head]
+
+    def get_size(self):
+        return sum(self._counts)
+
+    def reproduce(self, days):
+        size = len(self._counts)
+        for day in range(days):
+            # Spawning fish at timer 0 become the newborns at the top of the rotated ring
+            spawning = self._counts[self._head]
+            self._head = (self._head + 1) % size
+
+            # Newborns need moving when the ring is larger than their timer, before
+            # the spawners are added back in case the reset timer is the top slot
+            if self._newborn_timer != size - 1:
+                self._counts[(self._head + size - 1) % size] = 0
+                self._counts[(self._head + self._newborn_timer) % size] += spawning
+
+            # And the spawning fish themselves go back to the reset timer
+            self._counts[(self._head + self._reset_timer) % size] += spawning
+        self._day += days
+
+    def get_sizes(self, horizons, use_cache = True):
+        """
+        Get the population size after each of the specified numbers of days
+        in one forward pass over the sorted horizons. Each pass resumes from
+        the current day or the nearest cached checkpoint before the horizon,
+        and caches the counts at each horizon when specified.
+        """
+
+        sizes = {}
+        for horizon in sorted(set(horizons)):
+            # Restore the nearest checkpoint unless the current day is already closer
+            checkpoint = self._checkpoint_days[bisect_right(self._checkpoint_days, horizon) - 1]
+            if not checkpoint <= self._day <= horizon:
+                self._counts = list(self._checkpoints[checkpoint])
+                self._head = 0
+                self._day = checkpoint
+
+            self.reproduce(horizon - self._day)
+            sizes[horizon] = self.get_size()
+            if use_cache and horizon not in self._checkpoints:
+                self._checkpoints[horizon] = tuple(self.get_counts())
+                insort(self._checkpoint_days, horizon)
+
+        return [sizes[horizon] for horizon in horizons]
+
+def multiply_matrices(a, b):
+    """
+    Exact integer product of two square matrices given as lists of rows.
+    """
+
+    columns = list(zip(*b))
+    return [[sum(x*y for (x, y) in zip(row, column)) for column in columns] for row in a]
+
 def main(days, input_path):
     """
     Entry point for puzzle day 2021.12.06
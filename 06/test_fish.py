@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+
+import io
+
+from fish import RingSchool, School
+
+def test_ring_school_matches_projection_for_custom_timers():
+    """
+    RingSchool should agree with School.project for non-default timers,
+    including a reset timer above the newborn timer and initial timers
+    above both.
+    """
+
+    for (initial, reset_timer, newborn_timer) in [
+            ("3,4,3,1,2", 6, 8),
+            ("3,4,3,1,2", 2, 3),
+            ("1", 8, 6),
+            ("3,4,3,1,2,11", 9, 4)]:
+        for days in (0, 1, 18, 65):
+            school = School(io.StringIO(initial))
+            school.project(days, reset_timer, newborn_timer)
+            ring_school = RingSchool(io.StringIO(initial), reset_timer, newborn_timer)
+            ring_school.reproduce(days)
+            assert ring_school.get_size() == school.get_size()
+            assert {t:c for (t, c) in enumerate(ring_school.get_counts()) if c} == dict(school._fish)
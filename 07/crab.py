@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 
+from bisect import bisect_right
+from itertools import accumulate
 import math
+import numpy as np
 import sys
 
 class Swarm:
@@ -91,6 +94,479 @@ class Swarm:
             fuel += distance*(distance + 1)/2
         return fuel
 
+    def calculate_move(self, cost = "linear"):
+        """
+        Given any registered fuel cost (or a FuelCost), determine optimal final
+        position and total fuel usage with the generic optimizer.
+        """
+
+        if not isinstance(cost, FuelCost):
+            cost = fuel_costs[cost]
+        return optimize_move(self._crabs, cost)
+
+class MomentMoves:
+    """
+    Shared move calculations for swarms that can report their crab count,
+    position sum, and squared position sum through get_moments, along with
+    their median and total linear fuel for a position.
+    """
+
+    def calculate_triangular_distance(self, position):
+        """
+        Total arithmetic fuel for the specified position, which is half of the
+        sum of the squared distances plus the sum of the distances, and the
+        squared distances expand into the moments.
+        """
+
+        (count, total, square_total) = self.get_moments()
+        squared = square_total - 2*position*total + count*position*position
+        return (squared + self.calculate_linear_distance(position)) // 2
+
+    def calculate_linear_move(self):
+        """
+        Given linear fuel cost, determine optimal final position and total fuel usage.
+        """
+
+        median_position = self.calculate_median()
+        return (median_position, self.calculate_linear_distance(median_position))
+
+    def calculate_arithmetic_move(self):
+        """
+        Given arithmetic fuel cost, determine optimal final position and total fuel usage.
+
+        Stepping from p to p+1 changes the total by count*(p - mean) plus the
+        number of crabs at or left of p, so the fuel never rises on the way
+        up to the floor of the mean, and symmetrically never falls past its
+        ceiling. Only those two positions need checking.
+        """
+
+        (count, total, _) = self.get_moments()
+        candidates = sorted(set([total // count, -(-total // count)]))
+        (optimal_fuel, optimal_position) = min([(self.calculate_triangular_distance(c), c) for c in candidates])
+        return (optimal_position, optimal_fuel)
+
+class SortedSwarm(MomentMoves, Swarm):
+    """
+    A Swarm that sorts the positions once and keeps prefix sums of the
+    positions and their squares, so the total linear or triangular fuel
+    for any target is found in O(log n) with exact integer arithmetic.
+    """
+
+    def __init__(self, input_file):
+        # Read the positions as usual, then sort and accumulate them
+        super().__init__(input_file)
+        self._sorted = sorted(self._crabs)
+        self._sums = [0] + list(accumulate(self._sorted))
+        self._square_sums = [0] + list(accumulate([crab*crab for crab in self._sorted]))
+
+    def calculate_median(self):
+        """
+        Find the lower median of crab position values, which is always an
+        optimal linear target.
+        """
+
+        return self._sorted[(len(self._sorted) - 1) // 2]
+
+    def calculate_linear_distance(self, position):
+        """
+        Total linear fuel for the specified position, splitting the sorted
+        crabs into those at or left of the position and those right of it.
+        """
+
+        left = bisect_right(self._sorted, position)
+        right_sum = self._sums[-1] - self._sums[left]
+        right = len(self._sorted) - left
+        return (left*position - self._sums[left]) + (right_sum - right*position)
+
+    def get_moments(self):
+        return (len(self._sorted), self._sums[-1], self._square_sums[-1])
+
+class HistogramSwarm:
+    """
+    Represents a very large fleet of crab submarines as counts by position,
+    so memory depends on the range of positions rather than the fleet size.
+    The input is streamed in chunks straight into the counts.
+    """
+
+    def __init__(self, input_file, chunk_size = 1 << 24):
+        # Stream the single line of initial positions, carrying any number split between chunks
+        self._counts = np.zeros(0, dtype=np.int64)
+        self._minimum = 0
+        partial = ""
+        while True:
+            chunk = input_file.read(chunk_size)
+            tokens = (partial + chunk).strip().split(",")
+            if chunk:
+                partial = tokens.pop()
+            tokens = [t for t in tokens if t]
+            if tokens:
+                self._add_positions(np.array(tokens).astype(np.int64))
+            if not chunk:
+                break
+        self._size = int(self._counts.sum())
+
+    def _add_positions(self, positions):
+        # Count this chunk's positions relative to its own minimum
+        chunk_minimum = int(positions.min())
+        chunk_counts = np.bincount(positions - chunk_minimum)
+
+        # Grow the counts at either end to cover the chunk, offset by the lowest position seen
+        if not len(self._counts):
+            (self._counts, self._minimum) = (chunk_counts.astype(np.int64), chunk_minimum)
+            return
+        minimum = min(self._minimum, chunk_minimum)
+        maximum = max(self._minimum + len(self._counts), chunk_minimum + len(chunk_counts))
+        if minimum < self._minimum or maximum > self._minimum + len(self._counts):
+            self._counts = np.pad(self._counts, (self._minimum - minimum, maximum - self._minimum - len(self._counts)))
+            self._minimum = minimum
+        start = chunk_minimum - self._minimum
+        self._counts[start:start+len(chunk_counts)] += chunk_counts
+
+    def _generate_counts(self):
+        # Generate (position, count) pairs as exact Python integers without copying the counts
+        for (offset, count) in enumerate(self._counts):
+            yield (self._minimum + offset, int(count))
+
+    def __str__(self):
+        # Print the positions in sorted order
+        return ",".join([str(position) for (position, count) in self._generate_counts() for _ in range(count)])
+
+    def calculate_median(self):
+        """
+        Find the lower median of crab position values by counting through positions.
+        """
+
+        seen = 0
+        for (position, count) in self._generate_counts():
+            seen += count
+            if seen > (self._size - 1) // 2:
+                return position
+
+    def calculate_moves(self):
+        """
+        Evaluate the total linear and triangular fuel for every candidate
+        position in one pass, returning the optimal (position, fuel) for each.
+
+        Moving the target one step right adds one to the linear distance of
+        every crab at or left of the old target and removes one for every crab
+        right of it, while the triangular fuel of the left crabs grows by their
+        new distances and that of the right crabs shrinks by their old distances.
+        Positions are measured from the lowest one, since fuel only depends on distances.
+        """
+
+        # Start with every crab right of a target just left of the lowest position
+        left_count = 0
+        left_sum = 0
+        right_count = self._size
+        right_sum = 0
+        triangular = 0
+        for (position, count) in self._generate_counts():
+            offset = position - self._minimum
+            right_sum += offset*count
+            triangular += count*(offset + 1)*(offset + 2)//2
+        linear = right_sum + right_count
+
+        optimal_linear = None
+        optimal_triangular = None
+        for (position, count) in self._generate_counts():
+            # Step the target from the previous position to this one
+            offset = position - self._minimum
+            linear += left_count - right_count
+            triangular += left_count*offset - left_sum - (right_sum - right_count*(offset - 1))
+
+            if optimal_linear is None or linear < optimal_linear[1]:
+                optimal_linear = (position, linear)
+            if optimal_triangular is None or triangular < optimal_triangular[1]:
+                optimal_triangular = (position, triangular)
+
+            # Crabs at this position are left of the next target
+            left_count += count
+            left_sum += offset*count
+            right_count -= count
+            right_sum -= offset*count
+
+        return (optimal_linear, optimal_triangular)
+
+    def calculate_linear_move(self):
+        """
+        Given linear fuel cost, determine optimal final position and total fuel usage.
+        """
+
+        return self.calculate_moves()[0]
+
+    def calculate_arithmetic_move(self):
+        """
+        Given arithmetic fuel cost, determine optimal final position and total fuel usage.
+        """
+
+        return self.calculate_moves()[1]
+
+class FenwickTree:
+    """
+    Binary indexed tree over a fixed number of slots supporting point updates,
+    prefix sums, and finding the slot holding the k-th unit in O(log n).
+    """
+
+    def __init__(self, size):
+        self._tree = [0]*(size + 1)
+
+    def __len__(self):
+        return len(self._tree) - 1
+
+    def add(self, index, delta):
+        """
+        Add the delta to the value at the specified slot.
+        """
+
+        index += 1
+        while index < len(self._tree):
+            self._tree[index] += delta
+            index += index & -index
+
+    def prefix_sum(self, index):
+        """
+        Sum the values of the slots up to and including the specified slot.
+        """
+
+        index = min(index + 1, len(self._tree) - 1)
+        total = 0
+        while index > 0:
+            total += self._tree[index]
+            index -= index & -index
+        return total
+
+    def find(self, rank):
+        """
+        Find the first slot where the prefix sum exceeds the rank, for non-negative values.
+        """
+
+        index = 0
+        step = 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            if index + step < len(self._tree) and self._tree[index + step] <= rank:
+                index += step
+                rank -= self._tree[index]
+            step >>= 1
+        return index
+
+class DynamicSwarm(MomentMoves):
+    """
+    Represents a changing fleet of crab submarines, with crabs joining and
+    leaving over time. Counts and position sums are kept in Fenwick trees
+    over positions so the median, mean, optimal moves, and total fuel are
+    all available in logarithmic time after each change.
+    """
+
+    def __init__(self, input_file):
+        # Read the single line of initial positions, then add each crab
+        crabs = [int(i) for line in input_file for i in line.strip().split(",") if i]
+        self._counts = FenwickTree(0)
+        self._resize(max(crabs, default=0) + 1)
+        for crab in crabs:
+            self.add(crab)
+
+    def _resize(self, size):
+        # Rebuild the trees with room for positions up to the specified size, keeping any existing crabs
+        existing = [(p, self._counts.prefix_sum(p) - self._counts.prefix_sum(p - 1)) for p in range(len(self._counts))]
+        self._counts = FenwickTree(size)
+        self._sums = FenwickTree(size)
+        self._size = 0
+        self._total = 0
+        self._square_total = 0
+        for (position, count) in existing:
+            if count:
+                self._update(position, count)
+
+    def _update(self, position, count):
+        self._counts.add(position, count)
+        self._sums.add(position, position*count)
+        self._size += count
+        self._total += position*count
+        self._square_total += position*position*count
+
+    def __len__(self):
+        return self._size
+
+    def add(self, position):
+        """
+        Add a crab at the specified position, growing the trees if needed.
+        """
+
+        if position < 0:
+            raise ValueError("Crab position %d is negative" % position)
+        if position >= len(self._counts):
+            self._resize(max(position + 1, 2*len(self._counts)))
+        self._update(position, 1)
+
+    def remove(self, position):
+        """
+        Remove a crab from the specified position.
+        """
+
+        if position < 0 or position >= len(self._counts) or \
+                self._counts.prefix_sum(position) == self._counts.prefix_sum(position - 1):
+            raise ValueError("No crab at position %d" % position)
+        self._update(position, -1)
+
+    def calculate_median(self):
+        """
+        Find the lower median of crab position values.
+        """
+
+        return self._counts.find((self._size - 1) // 2)
+
+    def calculate_mean(self):
+        return self._total / self._size
+
+    def calculate_linear_distance(self, position):
+        """
+        Total linear fuel for the specified position from the counts and sums left of it.
+        """
+
+        left_count = self._counts.prefix_sum(position) if position >= 0 else 0
+        left_sum = self._sums.prefix_sum(position) if position >= 0 else 0
+        right_count = self._size - left_count
+        right_sum = self._total - left_sum
+        return (left_count*position - left_sum) + (right_sum - right_count*position)
+
+    def get_moments(self):
+        return (self._size, self._total, self._square_total)
+
+class FuelCost:
+    """
+    Interface for the fuel a single crab spends moving a given distance.
+
+    Implementations evaluate whole integer arrays of distances at once.
+    The optimizer relies on the total fuel being convex in the target
+    position, which holds whenever the per-distance cost is convex, and
+    falls back to checking every position for costs that say they aren't.
+    """
+
+    convex = True
+
+    def cost(self, distances):
+        raise NotImplementedError
+
+class LinearCost(FuelCost):
+    """
+    One fuel unit per step.
+    """
+
+    def cost(self, distances):
+        return distances
+
+class TriangularCost(FuelCost):
+    """
+    Each step costs one more fuel unit than the last.
+    """
+
+    def cost(self, distances):
+        return distances*(distances + 1)//2
+
+class QuadraticCost(FuelCost):
+    """
+    Fuel grows with the square of the distance.
+    """
+
+    def cost(self, distances):
+        return distances*distances
+
+class PiecewiseLinearCost(FuelCost):
+    """
+    Tariff charging each rate per step for the distance between its
+    breakpoint and the next one, with the last rate continuing forever.
+    Convex only when the rates never decrease.
+    """
+
+    def __init__(self, breakpoints, rates):
+        if len(breakpoints) != len(rates) or list(breakpoints) != sorted(breakpoints) or breakpoints[0] != 0:
+            raise ValueError("Breakpoints must be sorted from 0 with one rate each")
+        self._breakpoints = list(breakpoints)
+        self._rates = list(rates)
+        self.convex = self._rates == sorted(self._rates)
+
+    def cost(self, distances):
+        # Allow for fractional rates on integer distances
+        fuel = np.zeros(distances.shape, dtype=np.result_type(distances, *self._rates))
+        limits = self._breakpoints[1:] + [None]
+        for (breakpoint, limit, rate) in zip(self._breakpoints, limits, self._rates):
+            steps = np.maximum(distances - breakpoint, 0)
+            if limit is not None:
+                steps = np.minimum(steps, limit - breakpoint)
+            fuel += rate*steps
+        return fuel
+
+class CappedCost(FuelCost):
+    """
+    Another cost that stops growing at a maximum fuel per crab. Capping
+    makes the cost concave past the cap, so it's never treated as convex.
+    """
+
+    convex = False
+
+    def __init__(self, cost, cap):
+        self._cost = cost
+        self._cap = cap
+
+    def cost(self, distances):
+        return np.minimum(self._cost.cost(distances), self._cap)
+
+# Registry of named fuel costs, including the puzzle's linear and triangular costs
+fuel_costs = {}
+
+def register_fuel_cost(name, cost):
+    """
+    Register a FuelCost under a name usable with Swarm.calculate_move.
+    """
+
+    fuel_costs[name] = cost
+
+register_fuel_cost("linear", LinearCost())
+register_fuel_cost("triangular", TriangularCost())
+register_fuel_cost("quadratic", QuadraticCost())
+
+def calculate_total_fuels(crabs, cost, targets, batch_size = 1 << 22):
+    """
+    Evaluate the total fuel for many target positions at once, in batches
+    of targets so that at most roughly the batch size of distances exist
+    at a time.
+    """
+
+    crabs = np.asarray(crabs, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    targets_per_batch = max(1, batch_size // max(1, len(crabs)))
+
+    # Keep each batch's totals in whatever type the cost produces, so fractional tariffs aren't truncated
+    totals = [np.zeros(0, dtype=np.int64)]
+    for start in range(0, len(targets), targets_per_batch):
+        batch = targets[start:start+targets_per_batch]
+        totals.append(cost.cost(np.abs(crabs[None, :] - batch[:, None])).sum(axis=1))
+    return np.concatenate(totals)
+
+def optimize_move(crabs, cost, samples = 16):
+    """
+    Find the optimal final position and total fuel usage for any FuelCost.
+
+    For convex costs this generalizes ternary search: evaluate a batch of
+    evenly spaced targets at once, then narrow to the neighbors of the best
+    one, since a convex total can't have its minimum anywhere else. Costs
+    that aren't convex get every position in range checked in batches.
+    """
+
+    crabs = np.asarray(crabs, dtype=np.int64)
+    (low, high) = (int(crabs.min()), int(crabs.max()))
+    if cost.convex:
+        while high - low + 1 > samples:
+            targets = np.unique(np.linspace(low, high, samples).round().astype(np.int64))
+            best = int(np.argmin(calculate_total_fuels(crabs, cost, targets)))
+            (low, high) = (int(targets[max(best - 1, 0)]), int(targets[min(best + 1, len(targets) - 1)]))
+
+    # Check every remaining position directly, preferring the lowest on ties
+    targets = np.arange(low, high + 1)
+    totals = calculate_total_fuels(crabs, cost, targets)
+    best = int(np.argmin(totals))
+    return (int(targets[best]), totals[best].item())
+
 def main(input_path):
     """
     Entry point for puzzle day 2021.12.07
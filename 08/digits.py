@@ -1,5 +1,8 @@
 #!/usr/bin/env python3
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import os
 import sys
 
 def read_signals(input_file):
@@ -130,6 +133,175 @@ def get_decoded_values(signals):
     # Done
     return values
 
+def encode_pattern(pattern):
+    """
+    Encode a segment pattern as a 7-bit mask, one bit per segment a-g,
+    so the same segments in any order give the same value.
+    """
+
+    mask = 0
+    for segment in pattern:
+        mask |= 1 << (ord(segment) - ord("a"))
+    return mask
+
+def get_signature(mask, segment_counts):
+    """
+    Sum how many of the ten digits use each segment in a pattern. Relabelling
+    segments doesn't change these counts, so the sum identifies the digit
+    whatever the wiring.
+    """
+
+    return sum(count for (segment, count) in enumerate(segment_counts) if mask >> segment & 1)
+
+def count_segments(patterns):
+    """
+    Count how many of the patterns use each segment.
+    """
+
+    masks = [encode_pattern(p) for p in patterns]
+    return [sum(mask >> segment & 1 for mask in masks) for segment in range(7)]
+
+# Precomputed mapping from permutation-invariant signatures to digit values
+_actual_segment_counts = count_segments(actual_digit_segments)
+signature_digits = {get_signature(encode_pattern(segments), _actual_segment_counts):int(digit)
+    for (segments, digit) in actual_digit_segments.items()}
+
+def get_signature_decoded_values(signals):
+    """
+    Decode each signal output by looking up digits from their signatures,
+    without deducing the segment wiring.
+    """
+
+    values = []
+    for signal in signals:
+        # Map each of the ten observed patterns' masks straight to its digit
+        segment_counts = count_segments(signal["signal"])
+        digits_by_mask = {}
+        for pattern in signal["signal"]:
+            mask = encode_pattern(pattern)
+            digits_by_mask[mask] = signature_digits[get_signature(mask, segment_counts)]
+
+        # Then each output digit is a single lookup
+        value = 0
+        for encoded in signal["output"]:
+            value = value*10 + digits_by_mask[encode_pattern(encoded)]
+        values.append(value)
+
+    # Done
+    return values
+
+def encode_record(line):
+    """
+    Encode one line of the signal log as a compact fixed-size record of
+    14 bytes: the masks of the ten signal patterns then the four outputs.
+    """
+
+    (signal, digits) = line.strip().split(" | ")
+    return bytes([encode_pattern(p) for p in signal.split(" ") + digits.split(" ")])
+
+def generate_record_batches(input_file, batch_size):
+    """
+    Lazily encode the lines of a signal log into batches of concatenated records.
+    """
+
+    batch = []
+    for line in input_file:
+        if line.strip():
+            batch.append(encode_record(line))
+            if len(batch) == batch_size:
+                yield b"".join(batch)
+                batch = []
+    if batch:
+        yield b"".join(batch)
+
+def decode_record_batch(batch):
+    """
+    Decode a batch of concatenated records, returning the count of uniquely
+    identifiable output digits and the sum of the decoded output values.
+    """
+
+    unique_digit_count = 0
+    decoded_sum = 0
+    for start in range(0, len(batch), 14):
+        masks = batch[start:start+14]
+
+        # Count segment usage over the ten signal patterns for the signatures
+        segment_counts = [sum(mask >> segment & 1 for mask in masks[:10]) for segment in range(7)]
+
+        # Each output is uniquely identifiable by its number of segments, and decoded by its signature
+        value = 0
+        for mask in masks[10:]:
+            if bin(mask).count("1") in (2, 3, 4, 7):
+                unique_digit_count += 1
+            value = value*10 + signature_digits[get_signature(mask, segment_counts)]
+        decoded_sum += value
+
+    return (unique_digit_count, decoded_sum)
+
+def generate_range_lines(input_file, start, end):
+    """
+    Generate the lines of a binary file whose starts fall within the byte
+    range [start, end), so that adjacent ranges cover each line once.
+    """
+
+    # Skip the partial line that belongs to the previous range
+    if start > 0:
+        input_file.seek(start - 1)
+        input_file.readline()
+    else:
+        input_file.seek(0)
+
+    # Read whole lines until we pass the end of our range
+    while input_file.tell() < end:
+        line = input_file.readline()
+        if not line:
+            break
+        yield line.decode()
+
+def decode_log_range(input_path, start, end, batch_size):
+    """
+    Parse, encode, and decode the lines of a signal log starting within a
+    byte range, in batches of compact records, returning the totals.
+    """
+
+    unique_digit_count = 0
+    decoded_sum = 0
+    with open(input_path, "rb") as input_file:
+        for batch in generate_record_batches(generate_range_lines(input_file, start, end), batch_size):
+            (batch_unique, batch_sum) = decode_record_batch(batch)
+            unique_digit_count += batch_unique
+            decoded_sum += batch_sum
+    return (unique_digit_count, decoded_sum)
+
+def decode_signal_log(input_path, batch_size = 10000, workers = None, chunk_size = 1 << 22):
+    """
+    Stream a signal log of any size through a pool of processes, with each
+    worker parsing and decoding its own byte range of the file, keeping
+    running totals of the unique output digit count and the decoded sum.
+    Only a bounded number of ranges are in flight at a time, so memory
+    stays flat regardless of the log size.
+    """
+
+    unique_digit_count = 0
+    decoded_sum = 0
+    pending = deque()
+    max_pending = 2 * (workers or os.cpu_count() or 1)
+    file_size = os.path.getsize(input_path)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, file_size, chunk_size):
+            pending.append(executor.submit(decode_log_range, input_path, start, min(start + chunk_size, file_size), batch_size))
+            while len(pending) >= max_pending or (pending and pending[0].done()):
+                (range_unique, range_sum) = pending.popleft().result()
+                unique_digit_count += range_unique
+                decoded_sum += range_sum
+        while pending:
+            (range_unique, range_sum) = pending.popleft().result()
+            unique_digit_count += range_unique
+            decoded_sum += range_sum
+
+    # Done, return the running totals
+    return (unique_digit_count, decoded_sum)
+
 def main(input_path):
     """
     Entry point for puzzle day 2021.12.08
@@ -142,7 +314,7 @@ def main(input_path):
 
         # Calculate and print results
         print("Unique output values: %d" % get_unique_output_values(signals))
-        print("Decoded sum: %d" % sum(get_decoded_values(signals)))
+        print("Decoded sum: %d" % sum(get_signature_decoded_values(signals)))
 
 if __name__ == "__main__":
     main(sys.argv[1])